@@ -1,5 +1,7 @@
 use clap::Parser;
 
+use crate::protocol::Codec;
+
 /// Represents the command-line arguments for the server configuration
 #[derive(Parser, Debug, Clone)]
 #[command(name = "Server Engine")]
@@ -26,6 +28,18 @@ pub struct Cli
     #[arg(short = 'd', long, default_value_t = false)]
     pub(crate) debug_mode: bool,
 
+    /// Size in bytes of the kernel send and receive buffers of client sockets. Uses the OS default when unset
+    #[arg(short = 'b', long)]
+    pub(crate) socket_buffer_size: Option<u32>,
+
+    /// Also serve commands over UDP, on the same address and port as TCP
+    #[arg(long, default_value_t = false)]
+    pub(crate) udp: bool,
+
+    /// Wire format used for commands and responses (json, msgpack)
+    #[arg(short = 'c', long, value_enum, default_value_t = Codec::Json)]
+    pub(crate) codec: Codec,
+
     /// Log level (error, warn, info, debug, trace)
     #[arg(short = 'l', long, default_value = "info")]
     pub(crate) log_level: String,
@@ -27,11 +27,7 @@ pub fn delete_command(args: CommandArgs, db: Database) -> BoxFuture<'static, Res
             CommandArgs::Single(Some(key), ..) => {
                 let mut db_write = db.write().await;
                 if db_write.remove(&key).is_some() {
-                    NetResponse {
-                        action: NetActions::Command,
-                        value: Some("OK".to_string().into()),
-                        error: None,
-                    }
+                    NetResponse::ok()
                 } else {
                     NetResponse {
                         action: NetActions::Error,
@@ -28,11 +28,7 @@ pub fn insert_command(args: CommandArgs, db: Database) -> BoxFuture<'static, Res
             CommandArgs::Single(Some(key), Some(value)) => {
                 let mut db_write = db.write().await;
                 db_write.insert(key, value);
-                NetResponse {
-                    action: NetActions::Command,
-                    value: Some("OK".to_string().into()),
-                    error: None,
-                }
+                NetResponse::ok()
             }
             // Handle case where no key is provided
             CommandArgs::Single(None, ..) => NetResponse {
@@ -77,11 +73,7 @@ pub fn insert_command(args: CommandArgs, db: Database) -> BoxFuture<'static, Res
                 if insert_errors.is_empty() {
                     let mut db_lock = db.write().await;
                     db_lock.extend(temp_map);
-                    NetResponse {
-                        action: NetActions::Command,
-                        value: Some("OK".to_string().into()),
-                        error: None,
-                    }
+                    NetResponse::ok()
                 } else {
                     NetResponse {
                         action: NetActions::Error,
@@ -9,6 +9,7 @@ use crate::protocol::{Database, JsonValue, NetActions, NetResponse};
 ///
 /// This function handles both single key lookups and bulk lookups based on the provided `CommandArgs`.
 /// It retrieves the corresponding values from the database and formats them into a `NetResponse`.
+/// Bulk lookups return one entry per requested key, in order, with `null` for keys that don't exist.
 ///
 /// # Arguments
 ///
@@ -53,9 +54,8 @@ pub fn lookup_command(args: CommandArgs, db: Database) -> BoxFuture<'static, Res
 
                 for pair in pairs {
                     if let Some(key) = pair.key {
-                        if let Some(data) = db_read.get(&key) {
-                            results.push(data.value.to_owned());
-                        }
+                        // Keep a placeholder for missing keys so results line up with the requested keys
+                        results.push(db_read.get(&key).map_or(JsonValue::Null, |data| data.value.to_owned()));
                     } else {
                         return Ok(NetResponse {
                             action: NetActions::Error,
@@ -241,4 +241,38 @@ mod test
 
         assert_eq!(response.value, Some(expected_value));
     }
+
+    #[tokio::test]
+    async fn test_bulk_lookup_unknown_key()
+    {
+        let db = create_fake_db();
+        let value1 = DbValue {
+            value: json!("value1"),
+            expires_in: None,
+        };
+
+        {
+            let mut db_write = db.write().await;
+            db_write.insert("key1".to_string(), value1.clone());
+        }
+
+        let args = CommandArgs::Many(vec![
+            crate::commands::CommandParams {
+                key: Some("unknown".to_string()),
+                value: None,
+                ttl: None,
+            },
+            crate::commands::CommandParams {
+                key: Some("key1".to_string()),
+                value: None,
+                ttl: None,
+            },
+        ]);
+
+        let response = lookup_command(args, db.clone()).await.unwrap();
+
+        // Check that the unknown key keeps its position in the results
+        assert_eq!(response.action, NetActions::Command);
+        assert_eq!(response.value, Some(JsonValue::Array(vec![JsonValue::Null, value1.value])));
+    }
 }
@@ -10,7 +10,7 @@ use serde_json::Value;
 use crate::commands::delete::delete_command;
 use crate::commands::insert::insert_command;
 use crate::commands::lookup::lookup_command;
-use crate::protocol::{Database, DbKey, DbValue, NetActions, NetCommand, NetResponse};
+use crate::protocol::{CommandName, Database, DbKey, DbValue, NetActions, NetCommand, NetResponse};
 
 pub mod delete;
 pub mod insert;
@@ -50,22 +50,22 @@ where
 }
 
 // Map for storing command executors
-pub static COMMANDS: Lazy<HashMap<&'static str, Arc<dyn CommandExecutor>>> = Lazy::new(|| {
+pub static COMMANDS: Lazy<HashMap<CommandName, Arc<dyn CommandExecutor>>> = Lazy::new(|| {
     let mut map = HashMap::new();
-    map.insert("INSERT", Arc::new(insert_command) as Arc<dyn CommandExecutor>);
-    map.insert("INSERT *", Arc::new(insert_command) as Arc<dyn CommandExecutor>);
-    map.insert("LOOKUP", Arc::new(lookup_command) as Arc<dyn CommandExecutor>);
-    map.insert("LOOKUP *", Arc::new(lookup_command) as Arc<dyn CommandExecutor>);
-    map.insert("DELETE", Arc::new(delete_command) as Arc<dyn CommandExecutor>);
-    map.insert("DELETE *", Arc::new(delete_command) as Arc<dyn CommandExecutor>);
+    map.insert(CommandName::Insert, Arc::new(insert_command) as Arc<dyn CommandExecutor>);
+    map.insert(CommandName::InsertMany, Arc::new(insert_command) as Arc<dyn CommandExecutor>);
+    map.insert(CommandName::Lookup, Arc::new(lookup_command) as Arc<dyn CommandExecutor>);
+    map.insert(CommandName::LookupMany, Arc::new(lookup_command) as Arc<dyn CommandExecutor>);
+    map.insert(CommandName::Delete, Arc::new(delete_command) as Arc<dyn CommandExecutor>);
+    map.insert(CommandName::DeleteMany, Arc::new(delete_command) as Arc<dyn CommandExecutor>);
     map
 });
 
 /// Executes the command using the corresponding command executor.
 /// Returns a `NetResponse` indicating the success or failure of the command.
-async fn execute_command(command_name: &str, args: CommandArgs, db: Database) -> NetResponse
+async fn execute_command(command_name: CommandName, args: CommandArgs, db: Database) -> NetResponse
 {
-    if let Some(command_executor) = COMMANDS.get(command_name) {
+    if let Some(command_executor) = COMMANDS.get(&command_name) {
         match command_executor.execute(args, db).await {
             Ok(res) => res.into(),
             Err(err_msg) => NetResponse {
@@ -92,7 +92,7 @@ async fn handle_insert(keys: Option<Vec<DbKey>>, values: Option<Vec<DbValue>>, d
         values.and_then(|v| v.into_iter().next()),
     ) {
         execute_command(
-            "INSERT",
+            CommandName::Insert,
             CommandArgs::Single(
                 Some(key),
                 Some(DbValue {
@@ -118,6 +118,14 @@ async fn handle_insert(keys: Option<Vec<DbKey>>, values: Option<Vec<DbValue>>, d
 async fn handle_insert_bulk(keys: Option<Vec<DbKey>>, values: Option<Vec<DbValue>>, db: Database) -> NetResponse
 {
     if let (Some(keys), Some(values)) = (keys, values) {
+        if keys.len() != values.len() {
+            return NetResponse {
+                action: NetActions::Error,
+                value: None,
+                error: Some("Error: Bulk insert needs exactly one value per key.".to_string()),
+            };
+        }
+
         let params: Vec<CommandParams> = keys
             .into_iter()
             .zip(values)
@@ -128,7 +136,7 @@ async fn handle_insert_bulk(keys: Option<Vec<DbKey>>, values: Option<Vec<DbValue
             })
             .collect();
 
-        execute_command("INSERT *", CommandArgs::Many(params), db).await
+        execute_command(CommandName::InsertMany, CommandArgs::Many(params), db).await
     } else {
         NetResponse {
             action: NetActions::Error,
@@ -143,7 +151,7 @@ async fn handle_insert_bulk(keys: Option<Vec<DbKey>>, values: Option<Vec<DbValue
 async fn handle_lookup(keys: Option<Vec<DbKey>>, db: Database) -> NetResponse
 {
     if let Some(key) = keys.and_then(|k| k.into_iter().next()) {
-        execute_command("LOOKUP", CommandArgs::Single(Some(key), None), db).await
+        execute_command(CommandName::Lookup, CommandArgs::Single(Some(key), None), db).await
     } else {
         NetResponse {
             action: NetActions::Error,
@@ -167,7 +175,7 @@ async fn handle_lookup_bulk(keys: Option<Vec<DbKey>>, db: Database) -> NetRespon
                 ttl: None,
             })
             .collect();
-        execute_command("LOOKUP *", CommandArgs::Many(params), db).await
+        execute_command(CommandName::LookupMany, CommandArgs::Many(params), db).await
     } else {
         NetResponse {
             action: NetActions::Error,
@@ -182,7 +190,7 @@ async fn handle_lookup_bulk(keys: Option<Vec<DbKey>>, db: Database) -> NetRespon
 async fn handle_delete(keys: Option<Vec<DbKey>>, db: Database) -> NetResponse
 {
     if let Some(key) = keys.and_then(|k| k.into_iter().next()) {
-        execute_command("DELETE", CommandArgs::Single(Some(key), None), db).await
+        execute_command(CommandName::Delete, CommandArgs::Single(Some(key), None), db).await
     } else {
         NetResponse {
             action: NetActions::Error,
@@ -206,7 +214,7 @@ async fn handle_delete_bulk(keys: Option<Vec<DbKey>>, db: Database) -> NetRespon
                 ttl: None,
             })
             .collect();
-        execute_command("DELETE *", CommandArgs::Many(params), db).await
+        execute_command(CommandName::DeleteMany, CommandArgs::Many(params), db).await
     } else {
         NetResponse {
             action: NetActions::Error,
@@ -219,37 +227,134 @@ async fn handle_delete_bulk(keys: Option<Vec<DbKey>>, db: Database) -> NetRespon
 /// Main handler for processing commands.
 /// Matches the command name and delegates to the appropriate handler function.
 /// Returns a `NetResponse` based on the execution result of the command.
-pub async fn handler(command: NetCommand<'_>, db: Database) -> NetResponse
+pub async fn handler(command: NetCommand, db: Database) -> NetResponse
 {
-    let command_name = command.name.to_uppercase();
-    let keys: Option<Vec<DbKey>> = command.keys.map(|k_list| k_list.into_iter().map(|k| k.to_string()).collect());
-
-    // Map values to DbValue with optional TTL
-    let values: Option<Vec<DbValue>> = if let Some(vals) = command.values {
-        Some(
-            vals.into_iter()
-                .zip(command.ttls.unwrap_or(Vec::new()))  // Handle TTLs
-                .map(|(val, ttl)| DbValue {
-                    value: val.value,
-                    expires_in: Option::from(ttl),  // This now works as expires_in expects Option<Duration>
-                })
-                .collect(),
-        )
-    } else {
-        None
-    };
-
-    match command_name.as_str() {
-        "INSERT" => handle_insert(keys, values, db).await,
-        "LOOKUP" => handle_lookup(keys, db).await,
-        "DELETE" => handle_delete(keys, db).await,
-        "INSERT *" => handle_insert_bulk(keys, values, db).await,
-        "LOOKUP *" => handle_lookup_bulk(keys, db).await,
-        "DELETE *" => handle_delete_bulk(keys, db).await,
-        _ => NetResponse {
+    let keys: Option<Vec<DbKey>> = command.keys;
+
+    // Map values to DbValue, the TTL at the same position overrides the value's own. `ttls` may be shorter
+    // than `values` or missing entirely, so a batch doesn't need a TTL for every value.
+    let mut ttls = command.ttls.unwrap_or_default().into_iter();
+    let values: Option<Vec<DbValue>> = command.values.map(|vals| {
+        vals.into_iter()
+            .map(|val| DbValue {
+                expires_in: ttls.next().or(val.expires_in),
+                value: val.value,
+            })
+            .collect()
+    });
+
+    match command.name {
+        Some(CommandName::Insert) => handle_insert(keys, values, db).await,
+        Some(CommandName::Lookup) => handle_lookup(keys, db).await,
+        Some(CommandName::Delete) => handle_delete(keys, db).await,
+        Some(CommandName::InsertMany) => handle_insert_bulk(keys, values, db).await,
+        Some(CommandName::LookupMany) => handle_lookup_bulk(keys, db).await,
+        Some(CommandName::DeleteMany) => handle_delete_bulk(keys, db).await,
+        None => NetResponse {
             action: NetActions::Error,
             value: None,
             error: Some("Error: Unknown command.".to_string()),
         },
     }
 }
+
+#[cfg(test)]
+mod test
+{
+    use std::collections::HashMap;
+    use std::sync::Arc;
+    use std::time::Duration;
+
+    use serde_json::json;
+    use tokio::sync::RwLock;
+
+    use super::*;
+    use crate::protocol::JsonValue;
+
+    // Helper function to create a new in-memory database
+    fn create_fake_db() -> Database
+    {
+        Arc::new(RwLock::new(HashMap::new()))
+    }
+
+    // Helper function to build a command from its JSON form
+    fn command(value: JsonValue) -> NetCommand
+    {
+        serde_json::from_value(value).unwrap()
+    }
+
+    #[tokio::test]
+    async fn test_batched_commands()
+    {
+        let db = create_fake_db();
+
+        // Values without `ttls` are still inserted
+        let insert = command(json!({
+            "name": "INSERT *",
+            "keys": ["key1", "key2", "key3"],
+            "values": [
+                {"value": 1, "expires_in": null},
+                {"value": 2, "expires_in": null},
+                {"value": 3, "expires_in": null},
+            ],
+        }));
+        assert_eq!(handler(insert, db.clone()).await, NetResponse::ok());
+
+        // Results line up with the requested keys, missing keys included
+        let lookup = command(json!({"name": "LOOKUP *", "keys": ["key1", "missing", "key3"]}));
+        let response = handler(lookup, db.clone()).await;
+        assert_eq!(response.value, Some(json!([1, null, 3])));
+
+        let delete = command(json!({"name": "DELETE *", "keys": ["key1", "key2", "key3"]}));
+        let response = handler(delete, db.clone()).await;
+        assert_eq!(response.value, Some(json!(["key1", "key2", "key3"])));
+        assert!(db.read().await.is_empty());
+    }
+
+    #[tokio::test]
+    async fn test_batched_insert_ttls()
+    {
+        let db = create_fake_db();
+
+        let insert = command(json!({
+            "name": "INSERT *",
+            "keys": ["key1", "key2"],
+            "values": [{"value": 1, "expires_in": null}, {"value": 2, "expires_in": {"secs": 5, "nanos": 0}}],
+            "ttls": [{"secs": 60, "nanos": 0}],
+        }));
+        assert_eq!(handler(insert, db.clone()).await, NetResponse::ok());
+
+        let db_read = db.read().await;
+        assert_eq!(db_read["key1"].expires_in, Some(Duration::from_secs(60)));
+        assert_eq!(db_read["key2"].expires_in, Some(Duration::from_secs(5)));
+    }
+
+    #[tokio::test]
+    async fn test_unknown_command()
+    {
+        let db = create_fake_db();
+
+        for name in [json!("EXPLODE"), json!(42)] {
+            let response = handler(command(json!({"name": name})), db.clone()).await;
+
+            assert_eq!(response.action, NetActions::Error);
+            assert_eq!(response.error, Some("Error: Unknown command.".to_string()));
+        }
+    }
+
+    #[tokio::test]
+    async fn test_batched_insert_mismatched_values()
+    {
+        let db = create_fake_db();
+
+        let insert = command(json!({
+            "name": "INSERT *",
+            "keys": ["key1", "key2"],
+            "values": [{"value": 1, "expires_in": null}],
+        }));
+        let response = handler(insert, db.clone()).await;
+
+        assert_eq!(response.action, NetActions::Error);
+        assert!(db.read().await.is_empty());
+    }
+}
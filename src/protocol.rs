@@ -1,9 +1,11 @@
 use std::collections::HashMap;
-use std::fmt::Debug;
+use std::fmt::{Debug, Formatter};
 use std::sync::Arc;
 use std::time::Duration;
 
-use serde::{Deserialize, Serialize};
+use clap::ValueEnum;
+use serde::de::{Error, Visitor};
+use serde::{Deserialize, Deserializer, Serialize, Serializer};
 use serde_json::Value;
 use tokio::sync::RwLock;
 use tokio::time::Instant;
@@ -48,14 +50,117 @@ impl DbValue
     }
 }
 
+/// The commands understood by the server.
+///
+/// On the wire a command is identified either by its name, matched case-insensitively, or by its numeric
+/// opcode. Opcodes are a single byte in MessagePack and need no string comparison at all. Parsing the
+/// command into an enum once at decode time lets the handlers dispatch on a fixed set of variants instead
+/// of re-comparing strings for every request.
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
+#[repr(u8)]
+pub enum CommandName
+{
+    Insert = 0,
+    InsertMany = 1,
+    Lookup = 2,
+    LookupMany = 3,
+    Delete = 4,
+    DeleteMany = 5,
+}
+
+impl CommandName
+{
+    /// Every command supported by the server.
+    pub const ALL: [CommandName; 6] = [
+        CommandName::Insert,
+        CommandName::InsertMany,
+        CommandName::Lookup,
+        CommandName::LookupMany,
+        CommandName::Delete,
+        CommandName::DeleteMany,
+    ];
+
+    /// The name of the command as it appears on the wire.
+    pub fn as_str(&self) -> &'static str
+    {
+        match self {
+            CommandName::Insert => "INSERT",
+            CommandName::InsertMany => "INSERT *",
+            CommandName::Lookup => "LOOKUP",
+            CommandName::LookupMany => "LOOKUP *",
+            CommandName::Delete => "DELETE",
+            CommandName::DeleteMany => "DELETE *",
+        }
+    }
+
+    /// Finds the command with the given name, ignoring case.
+    pub fn from_name(name: &str) -> Option<Self>
+    {
+        CommandName::ALL
+            .into_iter()
+            .find(|command| command.as_str().eq_ignore_ascii_case(name))
+    }
+
+    /// Finds the command with the given opcode.
+    pub fn from_opcode(opcode: u64) -> Option<Self>
+    {
+        CommandName::ALL.into_iter().find(|command| *command as u64 == opcode)
+    }
+}
+
+impl Serialize for CommandName
+{
+    fn serialize<S: Serializer>(&self, serializer: S) -> Result<S::Ok, S::Error>
+    {
+        serializer.serialize_str(self.as_str())
+    }
+}
+
+/// Deserializes a command name or opcode.
+///
+/// Commands the server doesn't know give `None` rather than an error, so they can be answered with an
+/// error response like any other failed command instead of failing to decode the whole message.
+fn deserialize_command_name<'de, D: Deserializer<'de>>(deserializer: D) -> Result<Option<CommandName>, D::Error>
+{
+    struct CommandNameVisitor;
+
+    impl<'de> Visitor<'de> for CommandNameVisitor
+    {
+        type Value = Option<CommandName>;
+
+        fn expecting(&self, formatter: &mut Formatter) -> std::fmt::Result
+        {
+            formatter.write_str("a command name or opcode")
+        }
+
+        fn visit_u64<E: Error>(self, opcode: u64) -> Result<Self::Value, E>
+        {
+            Ok(CommandName::from_opcode(opcode))
+        }
+
+        fn visit_i64<E: Error>(self, opcode: i64) -> Result<Self::Value, E>
+        {
+            Ok(u64::try_from(opcode).ok().and_then(CommandName::from_opcode))
+        }
+
+        fn visit_str<E: Error>(self, name: &str) -> Result<Self::Value, E>
+        {
+            Ok(CommandName::from_name(name))
+        }
+    }
+
+    deserializer.deserialize_any(CommandNameVisitor)
+}
+
 /// Represents a command sent over the network to be processed by the server.
 #[derive(Serialize, Deserialize, Debug, PartialEq)]
-pub struct NetCommand<'a>
+pub struct NetCommand
 {
-    /// The name of the command.
-    pub name: &'a str,
+    /// The name of the command, or `None` if the server doesn't know it.
+    #[serde(deserialize_with = "deserialize_command_name")]
+    pub name: Option<CommandName>,
     /// Optional list of keys associated with the command.
-    pub keys: Option<Vec<&'a str>>,
+    pub keys: Option<Vec<DbKey>>,
     /// Optional list of values associated with the command.
     pub values: Option<Vec<DbValue>>,
     /// Optional list of data explorations
@@ -74,6 +179,29 @@ pub struct NetResponse
     pub error: Option<String>,
 }
 
+impl NetResponse
+{
+    /// Creates the plain acknowledgement returned by commands that succeed without a value to report.
+    pub fn ok() -> NetResponse
+    {
+        NetResponse {
+            action: NetActions::Command,
+            value: Some(JsonValue::String("OK".to_string())),
+            error: None,
+        }
+    }
+
+    /// Creates a response indicating that an error occurred.
+    pub fn error(error_message: String) -> NetResponse
+    {
+        NetResponse {
+            action: NetActions::Error,
+            value: None,
+            error: Some(error_message),
+        }
+    }
+}
+
 /// Enum representing possible network actions in response to commands.
 #[derive(Serialize, Deserialize, Debug, PartialEq)]
 pub enum NetActions
@@ -83,3 +211,117 @@ pub enum NetActions
     /// Indicates that an error occurred while processing a command.
     Error,
 }
+
+/// The wire format used to encode commands and responses.
+#[derive(ValueEnum, Clone, Copy, Debug, PartialEq)]
+pub enum Codec
+{
+    /// Plain JSON, readable by any client.
+    Json,
+    /// MessagePack, a compact binary encoding of the same schema.
+    #[value(name = "msgpack")]
+    MessagePack,
+}
+
+impl Codec
+{
+    /// Encodes a value into bytes using this codec.
+    pub fn encode<T: Serialize>(&self, value: &T) -> Result<Vec<u8>, String>
+    {
+        let mut buffer = Vec::new();
+        self.encode_into(value, &mut buffer)?;
+        Ok(buffer)
+    }
+
+    /// Encodes a value using this codec, appending the bytes to an existing buffer so its allocation can
+    /// be reused.
+    pub fn encode_into<T: Serialize>(&self, value: &T, buffer: &mut Vec<u8>) -> Result<(), String>
+    {
+        match self {
+            Codec::Json => serde_json::to_writer(buffer, value).map_err(|e| e.to_string()),
+            // Structs are written as maps so clients can keep sending plain dictionaries
+            Codec::MessagePack => rmp_serde::encode::write_named(buffer, value).map_err(|e| e.to_string()),
+        }
+    }
+
+    /// Decodes a value from bytes using this codec.
+    pub fn decode<'a, T: Deserialize<'a>>(&self, bytes: &'a [u8]) -> Result<T, String>
+    {
+        match self {
+            Codec::Json => serde_json::from_slice(bytes).map_err(|e| e.to_string()),
+            Codec::MessagePack => rmp_serde::from_slice(bytes).map_err(|e| e.to_string()),
+        }
+    }
+}
+
+#[cfg(test)]
+mod test
+{
+    use serde_json::json;
+
+    use super::*;
+
+    #[test]
+    fn test_codec_round_trip()
+    {
+        for codec in [Codec::Json, Codec::MessagePack] {
+            let response = NetResponse {
+                action: NetActions::Command,
+                value: Some(json!({"list": [1, 2.5, true, "hello"]})),
+                error: None,
+            };
+
+            let bytes = codec.encode(&response).unwrap();
+            assert_eq!(codec.decode::<NetResponse>(&bytes).unwrap(), response);
+        }
+    }
+
+    #[test]
+    fn test_codec_decode_command()
+    {
+        let command = json!({"name": "LOOKUP", "keys": ["key1"], "values": null, "ttls": null});
+
+        for codec in [Codec::Json, Codec::MessagePack] {
+            let bytes = codec.encode(&command).unwrap();
+            let decoded = codec.decode::<NetCommand>(&bytes).unwrap();
+            assert_eq!(decoded.name, Some(CommandName::Lookup));
+            assert_eq!(decoded.keys, Some(vec!["key1".to_string()]));
+        }
+    }
+
+    #[test]
+    fn test_command_name_is_case_insensitive()
+    {
+        assert_eq!(CommandName::from_name("insert"), Some(CommandName::Insert));
+        assert_eq!(CommandName::from_name("Lookup *"), Some(CommandName::LookupMany));
+        assert_eq!(CommandName::from_name("DELETE *"), Some(CommandName::DeleteMany));
+        assert_eq!(CommandName::from_name("EXPLODE"), None);
+    }
+
+    #[test]
+    fn test_command_opcode()
+    {
+        for codec in [Codec::Json, Codec::MessagePack] {
+            let command = json!({"name": CommandName::LookupMany as u8, "keys": ["key1", "key2"]});
+            let bytes = codec.encode(&command).unwrap();
+
+            let decoded = codec.decode::<NetCommand>(&bytes).unwrap();
+            assert_eq!(decoded.name, Some(CommandName::LookupMany));
+
+            let unknown = codec.encode(&json!({"name": 42})).unwrap();
+            assert_eq!(codec.decode::<NetCommand>(&unknown).unwrap().name, None);
+
+            let unknown = codec.encode(&json!({"name": "EXPLODE"})).unwrap();
+            assert_eq!(codec.decode::<NetCommand>(&unknown).unwrap().name, None);
+        }
+    }
+
+    #[test]
+    fn test_command_with_escaped_key()
+    {
+        let command: NetCommand = serde_json::from_str(r#"{"name":"delete","keys":["a\"b"]}"#).unwrap();
+
+        assert_eq!(command.name, Some(CommandName::Delete));
+        assert_eq!(command.keys, Some(vec!["a\"b".to_string()]));
+    }
+}
@@ -1,31 +1,56 @@
 use std::net::SocketAddr;
 
-use tokio::net::{TcpListener, TcpStream};
+use tokio::net::{TcpSocket, TcpStream, UdpSocket};
 use tokio::sync::mpsc;
 use tokio::sync::mpsc::{Receiver, Sender};
 use tracing::{debug, info};
 
 use crate::cli::Cli;
 use crate::protocol::{Database, DbEngine};
-use crate::services::tcp;
+use crate::services::{tcp, udp};
 
 pub async fn execute(args: &Cli, engine: &DbEngine) -> Result<(), Box<dyn std::error::Error>>
 {
     let socket = SocketAddr::new(args.addr.parse().unwrap(), args.port);
-    let listener = TcpListener::bind(socket).await?;
+
+    let tcp_socket = if socket.is_ipv4() {
+        TcpSocket::new_v4()?
+    } else {
+        TcpSocket::new_v6()?
+    };
+    // Matches `TcpListener::bind`, which only sets SO_REUSEADDR outside of Windows
+    #[cfg(not(windows))]
+    tcp_socket.set_reuseaddr(true)?;
+    // Connections are meant to be kept open and reused by clients. Keepalive probes let the OS notice and
+    // close the ones whose client has silently gone away.
+    tcp_socket.set_keepalive(true)?;
+    // Accepted client sockets inherit the keepalive and buffer size options of the listening socket
+    if let Some(size) = args.socket_buffer_size {
+        tcp_socket.set_send_buffer_size(size)?;
+        tcp_socket.set_recv_buffer_size(size)?;
+    }
+    tcp_socket.bind(socket)?;
+    let listener = tcp_socket.listen(1024)?;
 
     let (tx, mut rx): (Sender<(TcpStream, Database)>, Receiver<(TcpStream, Database)>) = mpsc::channel(1024);
+    let codec = args.codec;
 
     // Spawn task to handle streams
     tokio::spawn(async move {
         debug!("Starting TCP Service");
         while let Some((stream, db)) = rx.recv().await {
-            tokio::spawn(tcp::execute(stream, db));
+            tokio::spawn(tcp::execute(stream, db, codec));
         }
     });
 
     info!("Listening on {}", socket.to_string());
 
+    if args.udp {
+        let udp_socket = UdpSocket::bind(socket).await?;
+        tokio::spawn(udp::execute(udp_socket, engine.connection.clone(), codec));
+        info!("Listening on {} (UDP)", socket.to_string());
+    }
+
     // Main loop to accept connections and send to channel
     loop {
         let (stream, _) = listener.accept().await?;
@@ -5,6 +5,7 @@ use crate::protocol::DbEngine;
 
 pub mod tcp;
 pub mod ttl;
+pub mod udp;
 
 pub async fn execute(engine: Arc<DbEngine>) -> Result<(), Box<dyn std::error::Error>>
 {
@@ -1,115 +1,432 @@
-use tokio::io::{AsyncReadExt, AsyncWriteExt};
+use std::io;
+
+use tokio::io::{AsyncRead, AsyncReadExt, AsyncWriteExt, BufReader};
 use tokio::net::TcpStream;
 use tracing::{debug, error};
 
-use crate::protocol::{Database, NetActions, NetCommand, NetResponse};
+use crate::protocol::{Codec, Database, NetCommand, NetResponse};
+
+/// The largest frame, in bytes, the server will accept from a client.
+pub const MAX_FRAME_SIZE: usize = 16 * 1024 * 1024;
+
+/// The buffer capacity, in bytes, kept per connection between frames. Larger buffers are released once
+/// the frame that needed them has been handled.
+const RETAINED_BUFFER_SIZE: usize = 64 * 1024;
 
 /// Handles a single client connection over a TCP stream.
 ///
-/// This function reads commands from the client, processes them using the `handler` function,
-/// and sends back responses or error messages. It runs in a loop until the client disconnects.
+/// Every command and response is sent as a frame: a 4-byte big-endian length followed by that many bytes
+/// of encoded data. Because frames are self-delimiting, clients can pipeline many commands on one
+/// connection without waiting for each response.
+///
+/// Commands run one at a time in the order they were received, so a client always reads its own writes and
+/// responses come back in the order of their commands. Each response is encoded straight into a single batch
+/// buffer, right after its length prefix, and the batch is only written once no pipelined command is left in
+/// the read buffer, so a pipelined batch is answered with a single write.
 ///
 /// # Arguments
 ///
 /// * `stream` - The TCP stream representing the client connection.
 /// * `db` - The database instance used to process commands.
+/// * `codec` - The wire format used to decode commands and encode responses.
 ///
 /// # Returns
 ///
 /// A `Result` indicating success or failure of handling the stream. Errors are returned as `String`.
-pub async fn execute(mut stream: TcpStream, db: Database) -> Result<(), String>
+pub async fn execute(stream: TcpStream, db: Database, codec: Codec) -> Result<(), String>
 {
     let client_addr = stream
         .peer_addr()
-        .unwrap_or_else(|_| "unknown address".to_string().parse().unwrap());
+        .map(|addr| addr.to_string())
+        .unwrap_or_else(|_| "unknown address".to_string());
 
     debug!("New client connected: {}", client_addr);
 
-    let mut buffer = vec![0; 1024];
+    // Responses are already coalesced into batches before each write, so Nagle's algorithm would only delay them
+    if let Err(e) = stream.set_nodelay(true) {
+        error!("Failed to set TCP_NODELAY: {}", e);
+    }
+
+    let (reader, mut writer) = stream.into_split();
+    let mut reader = BufReader::new(reader);
+
+    // Reused for every frame and every batch, so steady-state reads and writes don't allocate
+    let mut frame = Vec::new();
+    let mut batch = Vec::new();
 
     loop {
-        match stream.read(&mut buffer).await {
-            Ok(size) => {
-                if size == 0 {
-                    // Client has disconnected
-                    debug!("Client disconnected: {}", client_addr);
-                    return Ok(());
-                }
-
-                // Deserialize the incoming data into a `NetCommand` struct
-                match serde_json::from_slice::<NetCommand>(&buffer[..size]) {
-                    Ok(command) => {
-                        // Process the command and get the response
-                        let response = crate::commands::handler(command, db.clone()).await;
-
-                        // Serialize the response to JSON format
-                        match serde_json::to_string(&response) {
-                            Ok(response_json) => {
-                                // Write the response back to the client
-                                if let Err(e) = stream.write_all(response_json.as_bytes()).await {
-                                    error!("Failed to write to stream: {}", e);
-                                    send_error_response(&mut stream, &e.to_string()).await?;
-                                    return Err(format!("Failed to write to stream: {}", e));
-                                }
-                            }
-                            Err(e) => {
-                                error!("Failed to serialize response: {}", e);
-                                send_error_response(&mut stream, &e.to_string()).await?;
-                                return Err(format!("Failed to serialize response: {}", e));
-                            }
-                        }
-                    }
-                    Err(e) => {
-                        error!("Failed to deserialize command: {}", e);
-                        send_error_response(&mut stream, &e.to_string()).await?;
-                        return Err(format!("Failed to deserialize command: {}", e));
-                    }
-                }
+        match read_frame(&mut reader, &mut frame).await {
+            Ok(true) => {}
+            Ok(false) => {
+                // Client has disconnected
+                debug!("Client disconnected: {}", client_addr);
+                return Ok(());
+            }
+            Err(e) if is_disconnect(&e) => {
+                // Pooled clients commonly drop idle connections with a reset rather than a clean close
+                debug!("Client disconnected: {} ({})", client_addr, e);
+                return Ok(());
             }
             Err(e) => {
                 error!("Failed to read from stream: {}", e);
-                send_error_response(&mut stream, &e.to_string()).await?;
+                // Deliver the responses already batched, followed by the error
+                let _ = encode_frame(&mut batch, &NetResponse::error(e.to_string()), codec);
+                let _ = writer.write_all(&batch).await;
                 return Err(format!("Failed to read from stream: {}", e));
             }
+        };
+
+        // Deserialize the incoming frame into a `NetCommand` struct. The frame boundary is known, so a
+        // malformed command only fails that command and not the whole connection.
+        let response = match codec.decode::<NetCommand>(&frame) {
+            Ok(command) => crate::commands::handler(command, db.clone()).await,
+            Err(e) => {
+                // The client gets the error in its response, logging it loudly as well would let one bad client
+                // flood the server's output
+                debug!("Failed to deserialize command: {}", e);
+                NetResponse::error(e)
+            }
+        };
+
+        // Serialize the response straight to bytes, skipping any intermediate `String`
+        if let Err(e) = encode_frame(&mut batch, &response, codec) {
+            error!("Failed to serialize response: {}", e);
+            // Deliver what was already encoded, followed by the error
+            let _ = encode_frame(&mut batch, &NetResponse::error(e.clone()), codec);
+            let _ = writer.write_all(&batch).await;
+            return Err(format!("Failed to serialize response: {}", e));
+        }
+
+        // Hold the batch back while more pipelined commands are already waiting to be processed
+        if !reader.buffer().is_empty() && batch.len() < RETAINED_BUFFER_SIZE {
+            continue;
+        }
+
+        match writer.write_all(&batch).await {
+            Ok(()) => {
+                batch.clear();
+                batch.shrink_to(RETAINED_BUFFER_SIZE);
+            }
+            // The client went away without reading its responses, there is nobody left to report to
+            Err(e) if is_disconnect(&e) => {
+                debug!("Client disconnected before reading its responses: {}", e);
+                return Ok(());
+            }
+            Err(e) => {
+                error!("Failed to write to stream: {}", e);
+                return Err(format!("Failed to write to stream: {}", e));
+            }
         }
     }
 }
 
-/// Sends an error response back to the client.
+/// Appends a response to `batch` as a length-prefixed frame.
 ///
-/// This function creates a `NetResponse` indicating an error and sends it over the TCP stream.
-///
-/// # Arguments
+/// The response is encoded in place after a placeholder prefix, which is then filled in with its length.
+/// On error `batch` is left as it was.
+fn encode_frame(batch: &mut Vec<u8>, response: &NetResponse, codec: Codec) -> Result<(), String>
+{
+    let start = batch.len();
+    batch.extend_from_slice(&[0; 4]);
+
+    let size = codec
+        .encode_into(response, batch)
+        .and_then(|()| u32::try_from(batch.len() - start - 4).map_err(|_| "Response too large.".to_string()));
+
+    match size {
+        Ok(size) => {
+            batch[start..start + 4].copy_from_slice(&size.to_be_bytes());
+            Ok(())
+        }
+        Err(e) => {
+            batch.truncate(start);
+            Err(e)
+        }
+    }
+}
+
+/// Whether an I/O error means the client closed the connection, rather than something going wrong.
+fn is_disconnect(e: &io::Error) -> bool
+{
+    matches!(
+        e.kind(),
+        io::ErrorKind::ConnectionReset | io::ErrorKind::ConnectionAborted | io::ErrorKind::BrokenPipe
+    )
+}
+
+/// Reads a single length-prefixed frame from the stream into `frame`, replacing its contents.
 ///
-/// * `stream` - The TCP stream representing the client connection.
-/// * `error_message` - The error message to include in the response.
+/// The payload is read straight into the existing allocation of `frame`, which only grows when a frame is
+/// larger than any seen before.
 ///
 /// # Returns
 ///
-/// A `Result` indicating success or failure of sending the error response. Errors are returned as `String`.
-async fn send_error_response(stream: &mut TcpStream, error_message: &str) -> Result<(), String>
+/// `true` if a frame was read, or `false` if the client closed the connection before sending another frame.
+async fn read_frame<R: AsyncRead + Unpin>(reader: &mut R, frame: &mut Vec<u8>) -> io::Result<bool>
 {
-    // Create an error response with the provided error message
-    let error_response = NetResponse {
-        action: NetActions::Error,
-        value: None,
-        error: Some(error_message.to_string()),
+    let size = match reader.read_u32().await {
+        Ok(size) => size as usize,
+        Err(e) if e.kind() == io::ErrorKind::UnexpectedEof => return Ok(false),
+        Err(e) => return Err(e),
     };
 
-    // Serialize the error response to JSON format
-    match serde_json::to_string(&error_response) {
-        Ok(response_json) => {
-            // Write the error response back to the client
-            if let Err(e) = stream.write_all(response_json.as_bytes()).await {
-                error!("Failed to write error response to stream: {}", e);
-                return Err(format!("Failed to write error response to stream: {}", e));
-            }
+    if size > MAX_FRAME_SIZE {
+        return Err(io::Error::new(
+            io::ErrorKind::InvalidData,
+            format!("Frame of {} bytes exceeds the {} byte limit.", size, MAX_FRAME_SIZE),
+        ));
+    }
+
+    frame.clear();
+    frame.shrink_to(RETAINED_BUFFER_SIZE.max(size));
+
+    if reader.take(size as u64).read_to_end(frame).await? < size {
+        return Err(io::ErrorKind::UnexpectedEof.into());
+    }
+
+    Ok(true)
+}
+
+#[cfg(test)]
+mod test
+{
+    use std::collections::HashMap;
+    use std::sync::Arc;
+
+    use serde_json::json;
+    use tokio::net::TcpListener;
+    use tokio::sync::RwLock;
+
+    use super::*;
+    use crate::protocol::{DbValue, NetActions};
+
+    // Helper function to write a single length-prefixed frame, the way a client would
+    async fn write_frame<W: AsyncWriteExt + Unpin>(writer: &mut W, payload: &[u8]) -> io::Result<()>
+    {
+        writer.write_u32(payload.len() as u32).await?;
+        writer.write_all(payload).await
+    }
+
+    // Helper function to start a server task on an ephemeral port
+    async fn spawn_server(db: Database) -> TcpStream
+    {
+        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
+        let addr = listener.local_addr().unwrap();
+
+        tokio::spawn(async move {
+            let (stream, _) = listener.accept().await.unwrap();
+            execute(stream, db, Codec::Json).await
+        });
+
+        TcpStream::connect(addr).await.unwrap()
+    }
+
+    #[tokio::test]
+    async fn test_client_reset_is_a_disconnect()
+    {
+        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
+        let client = TcpStream::connect(listener.local_addr().unwrap()).await.unwrap();
+        let (stream, _) = listener.accept().await.unwrap();
+
+        // Closing with a zero linger sends a reset instead of a FIN
+        client.set_linger(Some(std::time::Duration::ZERO)).unwrap();
+        drop(client);
+
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        assert_eq!(execute(stream, db, Codec::Json).await, Ok(()));
+    }
+
+    #[tokio::test]
+    async fn test_frame_round_trip()
+    {
+        let (mut client, mut server) = tokio::io::duplex(64);
+
+        write_frame(&mut client, b"hello").await.unwrap();
+        write_frame(&mut client, b"hi").await.unwrap();
+        drop(client);
+
+        let mut frame = Vec::new();
+        assert!(read_frame(&mut server, &mut frame).await.unwrap());
+        assert_eq!(frame, b"hello");
+        assert!(read_frame(&mut server, &mut frame).await.unwrap());
+        assert_eq!(frame, b"hi");
+        assert!(!read_frame(&mut server, &mut frame).await.unwrap());
+    }
+
+    #[tokio::test]
+    async fn test_encode_frame()
+    {
+        let mut batch = Vec::new();
+        encode_frame(&mut batch, &NetResponse::ok(), Codec::Json).unwrap();
+        encode_frame(&mut batch, &NetResponse::error("boom".to_string()), Codec::Json).unwrap();
+
+        let mut reader = batch.as_slice();
+        let mut frame = Vec::new();
+
+        assert!(read_frame(&mut reader, &mut frame).await.unwrap());
+        assert_eq!(serde_json::from_slice::<NetResponse>(&frame).unwrap(), NetResponse::ok());
+        assert!(read_frame(&mut reader, &mut frame).await.unwrap());
+        assert_eq!(
+            serde_json::from_slice::<NetResponse>(&frame).unwrap(),
+            NetResponse::error("boom".to_string())
+        );
+        assert!(!read_frame(&mut reader, &mut frame).await.unwrap());
+    }
+
+    #[tokio::test]
+    async fn test_oversized_frame()
+    {
+        let (mut client, mut server) = tokio::io::duplex(64);
+
+        client.write_u32(MAX_FRAME_SIZE as u32 + 1).await.unwrap();
+
+        let err = read_frame(&mut server, &mut Vec::new()).await.unwrap_err();
+        assert_eq!(err.kind(), io::ErrorKind::InvalidData);
+    }
+
+    #[tokio::test]
+    async fn test_truncated_frame()
+    {
+        let (mut client, mut server) = tokio::io::duplex(64);
+
+        client.write_u32(10).await.unwrap();
+        client.write_all(b"short").await.unwrap();
+        drop(client);
+
+        let err = read_frame(&mut server, &mut Vec::new()).await.unwrap_err();
+        assert_eq!(err.kind(), io::ErrorKind::UnexpectedEof);
+    }
+
+    #[tokio::test(flavor = "multi_thread")]
+    async fn test_pipelined_commands()
+    {
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        let mut client = spawn_server(db).await;
+
+        let commands = [
+            json!({
+                "name": "INSERT",
+                "keys": ["key"],
+                "values": [{"value": 42, "expires_in": null}],
+                "ttls": [{"secs": 60, "nanos": 0}],
+            }),
+            json!({"name": "LOOKUP", "keys": ["key"]}),
+            json!({"name": "UNKNOWN"}),
+            json!({"name": "DELETE", "keys": ["key"]}),
+        ];
+
+        // Send every command before reading any response
+        let mut batch = Vec::new();
+        for command in &commands {
+            write_frame(&mut batch, &serde_json::to_vec(command).unwrap()).await.unwrap();
         }
-        Err(e) => {
-            error!("Failed to serialize error response: {}", e);
-            return Err(format!("Failed to serialize error response: {}", e));
+        client.write_all(&batch).await.unwrap();
+
+        let mut frame = Vec::new();
+        let mut responses = Vec::new();
+        for _ in &commands {
+            assert!(read_frame(&mut client, &mut frame).await.unwrap());
+            responses.push(serde_json::from_slice::<NetResponse>(&frame).unwrap());
+        }
+
+        assert_eq!(responses[0].value, Some(json!("OK")));
+        assert_eq!(responses[1].value, Some(json!(42)));
+        assert_eq!(responses[2].action, NetActions::Error);
+        assert_eq!(responses[2].error, Some("Error: Unknown command.".to_string()));
+        assert_eq!(responses[3].value, Some(json!("OK")));
+    }
+
+    // Helper function to pipeline every command in one write and read back all of their responses
+    async fn pipeline(client: &mut TcpStream, commands: &[serde_json::Value]) -> Vec<NetResponse>
+    {
+        let mut batch = Vec::new();
+        for command in commands {
+            write_frame(&mut batch, &serde_json::to_vec(command).unwrap()).await.unwrap();
+        }
+        client.write_all(&batch).await.unwrap();
+
+        let mut frame = Vec::new();
+        let mut responses = Vec::new();
+        for _ in commands {
+            assert!(read_frame(client, &mut frame).await.unwrap());
+            responses.push(serde_json::from_slice::<NetResponse>(&frame).unwrap());
+        }
+        responses
+    }
+
+    #[tokio::test(flavor = "multi_thread")]
+    async fn test_pipelined_insert_then_lookup()
+    {
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        let mut client = spawn_server(db).await;
+
+        let mut commands = Vec::new();
+        for i in 0..200 {
+            commands.push(json!({"name": "INSERT", "keys": ["key"], "values": [{"value": i, "expires_in": null}]}));
+            commands.push(json!({"name": "LOOKUP", "keys": ["key"]}));
+        }
+
+        let responses = pipeline(&mut client, &commands).await;
+
+        // Every lookup sees the insert sent right before it
+        for (i, pair) in responses.chunks(2).enumerate() {
+            assert_eq!(pair[0], NetResponse::ok());
+            assert_eq!(pair[1].value, Some(json!(i)));
+        }
+    }
+
+    #[tokio::test(flavor = "multi_thread")]
+    async fn test_pipelined_delete_then_insert()
+    {
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        let mut client = spawn_server(db.clone()).await;
+
+        let insert = json!({"name": "INSERT", "keys": ["key"], "values": [{"value": "hello", "expires_in": null}]});
+        let delete = json!({"name": "DELETE", "keys": ["key"]});
+
+        let mut commands = vec![insert.clone()];
+        for _ in 0..200 {
+            commands.push(delete.clone());
+            commands.push(insert.clone());
         }
+
+        let responses = pipeline(&mut client, &commands).await;
+
+        // Every delete removes the key inserted right before it, and the last insert wins
+        assert!(responses.iter().all(|response| *response == NetResponse::ok()));
+        assert_eq!(db.read().await["key"].value, json!("hello"));
     }
 
-    Ok(())
+    #[tokio::test(flavor = "multi_thread")]
+    async fn test_pipelined_responses_keep_order()
+    {
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        {
+            let mut db_write = db.write().await;
+            for i in 0..100 {
+                db_write.insert(
+                    format!("key_{}", i),
+                    DbValue {
+                        value: json!(i),
+                        expires_in: None,
+                    },
+                );
+            }
+        }
+        let mut client = spawn_server(db).await;
+
+        let mut batch = Vec::new();
+        for i in 0..100 {
+            let command = json!({"name": "LOOKUP", "keys": [format!("key_{}", i)]});
+            write_frame(&mut batch, &serde_json::to_vec(&command).unwrap()).await.unwrap();
+        }
+        client.write_all(&batch).await.unwrap();
+
+        let mut frame = Vec::new();
+        for i in 0..100 {
+            assert!(read_frame(&mut client, &mut frame).await.unwrap());
+            let response = serde_json::from_slice::<NetResponse>(&frame).unwrap();
+            assert_eq!(response.value, Some(json!(i)));
+        }
+    }
 }
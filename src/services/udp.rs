@@ -0,0 +1,232 @@
+use std::net::SocketAddr;
+use std::sync::Arc;
+
+use tokio::net::UdpSocket;
+use tokio::sync::Semaphore;
+use tracing::{debug, error};
+
+use crate::protocol::{Codec, Database, NetCommand, NetResponse};
+
+/// The largest payload, in bytes, a UDP datagram can carry.
+pub const MAX_DATAGRAM_SIZE: usize = 65_507;
+
+/// How many times larger than its command a response may be.
+///
+/// The source address of a datagram is not verified, so without this limit a tiny spoofed `LOOKUP` of a large
+/// value would make the server send a much larger reply to someone else.
+pub const MAX_AMPLIFICATION: usize = 4;
+
+/// The size, in bytes, a response may always reach, however short its command.
+///
+/// Without it a short command such as a `LOOKUP` of a short key could get no reply at all. This always leaves room
+/// for the fixed-size error sent in place of a response that is too large.
+pub const MIN_RESPONSE_SIZE: usize = 128;
+
+/// The number of commands received over UDP that may run at once. Datagrams arriving while this many are
+/// running are dropped.
+pub const MAX_IN_FLIGHT: usize = 1024;
+
+/// The error sent in place of a response that is too large to send over UDP.
+const RESPONSE_TOO_LARGE: &str = "Error: Response too large for UDP, use TCP instead.";
+
+/// Serves commands sent as UDP datagrams.
+///
+/// Each datagram holds exactly one encoded command, without the length prefix used over TCP, and is answered
+/// with a single datagram holding the encoded response. This skips connection setup entirely, which suits
+/// short one-shot commands.
+///
+/// A response may be at most `MAX_AMPLIFICATION` times the size of its command, or `MIN_RESPONSE_SIZE` bytes for
+/// short commands. Larger responses are replaced with a fixed-size error asking the client to use TCP.
+///
+/// Every datagram is handled in its own task, so a command waiting on the database doesn't hold up other
+/// clients. At most `MAX_IN_FLIGHT` commands run at once, and datagrams received beyond that are dropped, as
+/// the network may drop any datagram. Datagrams carry no ordering, so commands sent over UDP may run in any
+/// order.
+///
+/// # Arguments
+///
+/// * `socket` - The bound UDP socket to serve commands on.
+/// * `db` - The database instance used to process commands.
+/// * `codec` - The wire format used to decode commands and encode responses.
+pub async fn execute(socket: UdpSocket, db: Database, codec: Codec)
+{
+    debug!("Starting UDP Service");
+
+    let socket = Arc::new(socket);
+    let permits = Arc::new(Semaphore::new(MAX_IN_FLIGHT));
+    let mut buffer = vec![0; MAX_DATAGRAM_SIZE];
+
+    loop {
+        let (size, client_addr) = match socket.recv_from(&mut buffer).await {
+            Ok(received) => received,
+            Err(e) => {
+                // Errors such as an ICMP port unreachable from an earlier reply only affect a single client
+                debug!("Failed to receive datagram: {}", e);
+                continue;
+            }
+        };
+
+        // Bounds the tasks a flood of datagrams can pile up while the database is busy
+        let Ok(permit) = permits.clone().try_acquire_owned() else {
+            debug!("Dropped a datagram from {}, too many commands in flight", client_addr);
+            continue;
+        };
+
+        let max_response_size = (size * MAX_AMPLIFICATION).clamp(MIN_RESPONSE_SIZE, MAX_DATAGRAM_SIZE);
+
+        match codec.decode::<NetCommand>(&buffer[..size]) {
+            Ok(command) => {
+                let (socket, db) = (socket.clone(), db.clone());
+                tokio::spawn(async move {
+                    let response = crate::commands::handler(command, db).await;
+                    send_response(&socket, client_addr, &response, max_response_size, codec).await;
+                    drop(permit);
+                });
+            }
+            Err(e) => {
+                // The client gets the error in its response, logging it loudly as well would let one bad client
+                // flood the server's output
+                debug!("Failed to deserialize command: {}", e);
+                send_response(&socket, client_addr, &NetResponse::error(e), max_response_size, codec).await;
+            }
+        }
+    }
+}
+
+/// Sends a response as a single datagram, replacing it with an error if it is larger than `max_size`.
+async fn send_response(socket: &UdpSocket, client_addr: SocketAddr, response: &NetResponse, max_size: usize, codec: Codec)
+{
+    let mut response_bytes = match codec.encode(response) {
+        Ok(response_bytes) => response_bytes,
+        Err(e) => {
+            error!("Failed to serialize response: {}", e);
+            return;
+        }
+    };
+
+    if response_bytes.len() > max_size {
+        // Always fits within `MIN_RESPONSE_SIZE`, so every command gets an answer
+        response_bytes = match codec.encode(&NetResponse::error(RESPONSE_TOO_LARGE.to_string())) {
+            Ok(response_bytes) => response_bytes,
+            Err(e) => {
+                error!("Failed to serialize response: {}", e);
+                return;
+            }
+        };
+    }
+
+    if let Err(e) = socket.send_to(&response_bytes, client_addr).await {
+        error!("Failed to send datagram to {}: {}", client_addr, e);
+    }
+}
+
+#[cfg(test)]
+mod test
+{
+    use std::collections::HashMap;
+    use std::sync::Arc;
+
+    use serde_json::json;
+    use tokio::sync::RwLock;
+
+    use super::*;
+    use crate::protocol::{DbValue, NetActions};
+
+    // Helper function to send a command and wait for its response
+    async fn send_command(client: &UdpSocket, command: serde_json::Value) -> NetResponse
+    {
+        let mut buffer = vec![0; MAX_DATAGRAM_SIZE];
+
+        client.send(&serde_json::to_vec(&command).unwrap()).await.unwrap();
+        let size = client.recv(&mut buffer).await.unwrap();
+
+        serde_json::from_slice(&buffer[..size]).unwrap()
+    }
+
+    #[tokio::test]
+    async fn test_udp_commands()
+    {
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        let server = UdpSocket::bind("127.0.0.1:0").await.unwrap();
+        let client = UdpSocket::bind("127.0.0.1:0").await.unwrap();
+        client.connect(server.local_addr().unwrap()).await.unwrap();
+        tokio::spawn(execute(server, db, Codec::Json));
+
+        let insert = json!({
+            "name": "INSERT",
+            "keys": ["key"],
+            "values": [{"value": "hello", "expires_in": null}],
+            "ttls": [{"secs": 60, "nanos": 0}],
+        });
+        assert_eq!(send_command(&client, insert).await.value, Some(json!("OK")));
+
+        let lookup = json!({"name": "LOOKUP", "keys": ["key"]});
+        assert_eq!(send_command(&client, lookup).await.value, Some(json!("hello")));
+
+        let unknown = json!({"name": "UNKNOWN"});
+        let response = send_command(&client, unknown).await;
+        assert_eq!(response.action, NetActions::Error);
+        assert_eq!(response.error, Some("Error: Unknown command.".to_string()));
+    }
+
+    #[tokio::test]
+    async fn test_udp_amplification_limit()
+    {
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        {
+            let mut db_write = db.write().await;
+            db_write.insert(
+                "big".to_string(),
+                DbValue {
+                    value: json!("x".repeat(10_000)),
+                    expires_in: None,
+                },
+            );
+        }
+
+        let server = UdpSocket::bind("127.0.0.1:0").await.unwrap();
+        let client = UdpSocket::bind("127.0.0.1:0").await.unwrap();
+        client.connect(server.local_addr().unwrap()).await.unwrap();
+        tokio::spawn(execute(server, db, Codec::Json));
+
+        let lookup = json!({"name": "LOOKUP", "keys": ["big"], "values": null, "ttls": null});
+        let response = send_command(&client, lookup).await;
+
+        assert_eq!(response.action, NetActions::Error);
+        assert_eq!(response.error, Some(RESPONSE_TOO_LARGE.to_string()));
+    }
+
+    #[tokio::test]
+    async fn test_udp_short_command()
+    {
+        let db: Database = Arc::new(RwLock::new(HashMap::new()));
+        {
+            let mut db_write = db.write().await;
+            db_write.insert(
+                "k".to_string(),
+                DbValue {
+                    value: json!("x".repeat(50)),
+                    expires_in: None,
+                },
+            );
+        }
+
+        let server = UdpSocket::bind("127.0.0.1:0").await.unwrap();
+        let client = UdpSocket::bind("127.0.0.1:0").await.unwrap();
+        client.connect(server.local_addr().unwrap()).await.unwrap();
+        tokio::spawn(execute(server, db, Codec::Json));
+
+        // The reply is more than `MAX_AMPLIFICATION` times the size of this command, but fits `MIN_RESPONSE_SIZE`
+        let lookup = json!({"name": 2, "keys": ["k"]});
+        assert_eq!(send_command(&client, lookup).await.value, Some(json!("x".repeat(50))));
+    }
+
+    #[test]
+    fn test_response_too_large_fits_min_response_size()
+    {
+        for codec in [Codec::Json, Codec::MessagePack] {
+            let bytes = codec.encode(&NetResponse::error(RESPONSE_TOO_LARGE.to_string())).unwrap();
+            assert!(bytes.len() <= MIN_RESPONSE_SIZE);
+        }
+    }
+}